@@ -15,18 +15,64 @@ Infinite text-based RPG that adapts to your psychology.
 """
 
 import json
+import math
 import os
 import random
-import requests
 import textwrap
 import time
 import sys
 import re
 from datetime import datetime
+from importlib.util import find_spec
+from functools import lru_cache
+
+try:
+    import orjson  # Опционально: быстрый JSON, если установлен
+except ImportError:
+    orjson = None
+
+def reject_constant(name):
+    """stdlib json принимает NaN/Infinity — orjson нет; держим оба пути одинаковыми."""
+    raise ValueError(f"Non-finite JSON constant: {name}")
+
+def parse_finite_float(text):
+    """1e400 в stdlib превращается в inf, orjson такое отвергает."""
+    value = float(text)
+    if not math.isfinite(value): raise ValueError(f"Non-finite JSON number: {text}")
+    return value
+
+if orjson:
+    json_loads = orjson.loads
+else:
+    def json_loads(data):
+        return json.loads(data, parse_constant=reject_constant, parse_float=parse_finite_float)
+
+def is_finite_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+def sanitize_floats(obj):
+    """inf/nan -> None. Только для старых сохранений: stdlib json писал Infinity/NaN."""
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {k: sanitize_floats(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [sanitize_floats(v) for v in obj]
+    return obj
+
+def json_dumps(data, pretty=False):
+    """JSON в UTF-8 байтах; отступы только по запросу.
+
+    inf/nan сюда не доходят: json_loads их отвергает, а entropy проверяет GameState.save.
+    """
+    if orjson:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 if pretty else 0)
+    return json.dumps(data, ensure_ascii=False, allow_nan=False, indent=2 if pretty else None).encode('utf-8')
 
 # --- КОНФИГУРАЦИЯ ---
 STATE_FILE = "janus_world_state.json"
 KEY_FILE = "janus.key"
+DEBUG = os.environ.get("JANUS_DEBUG") == "1"  # Читаемый (с отступами) файл мира
 
 # --- ИКОНКИ ---
 class Icon:
@@ -72,6 +118,25 @@ SYSTEM_PROMPT = """
 }
 """
 
+# Статичная часть запроса собирается один раз
+PROMPT_HEADER = SYSTEM_PROMPT + "\n\n"
+MODELS = ("gemini-1.5-flash", "gemini-1.5-flash-8b", "gemini-2.0-flash-exp")
+API_HEADERS = {"Content-Type": "application/json"}
+
+# Одна сессия на всю игру: keep-alive и повторное использование TLS
+SESSION = None
+REQUESTS_MISSING = "Не найдена библиотека requests. Установите: pip install requests"
+
+def get_session():
+    """requests импортируется лениво: меню и загрузка мира не ждут его импорта."""
+    global SESSION
+    if SESSION is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+        SESSION = requests.Session()
+        SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=0))
+    return SESSION
+
 # --- МЕНЕДЖЕР КЛЮЧЕЙ (GITHUB SAFE) ---
 def get_api_keys():
     """Безопасная загрузка ключей из файла или ввод вручную."""
@@ -115,32 +180,78 @@ class GameState:
         self.lore = []
         self.last_context = ""
         self.psych_profile = "Neutral"
+        self._saved_hash = None
 
     def load(self):
-        if os.path.exists(STATE_FILE):
+        if not os.path.exists(STATE_FILE): return
+        try:
+            with open(STATE_FILE, 'rb') as f:
+                raw = f.read()
+            try: data = json_loads(raw)
+            except ValueError:
+                # Старые сохранения: stdlib json читает Infinity/NaN, затем чистим
+                data = sanitize_floats(json.loads(raw))
+            self.__dict__.update(data)
+        except Exception:
+            # Нечитаемый мир не перезаписываем молча — откладываем в .bak
+            backup = STATE_FILE + ".bak"
             try:
-                with open(STATE_FILE, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    self.__dict__.update(data)
-            except: pass
+                os.replace(STATE_FILE, backup)
+                print(f"{Col.RED}{Icon.WARN} Файл мира повреждён, сохранён как {backup}. Начинаем заново.{Col.RESET}")
+            except OSError:
+                print(f"{Col.RED}{Icon.WARN} Файл мира повреждён ({STATE_FILE}). Начинаем заново.{Col.RESET}")
+        # inf/nan из старых сохранений превращаются в null
+        if not is_finite_number(self.entropy): self.entropy = 0.1
 
     def save(self):
-        data = self.__dict__.copy()
-        data['timestamp'] = datetime.now().isoformat()
-        with open(STATE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        # entropy — единственный float, который игра считает сама
+        if not is_finite_number(self.entropy): self.entropy = 0.1
+        data = {k: v for k, v in self.__dict__.items() if not k.startswith('_') and k != 'timestamp'}
+        payload = json_dumps(data, pretty=DEBUG)
+        # Мир не изменился — не трогаем диск
+        snapshot = hash(payload)
+        if snapshot == self._saved_hash: return
+        # timestamp вклеивается вне сравниваемой части: один дамп мира на сохранение
+        stamp = json_dumps({'timestamp': datetime.now().isoformat()}, pretty=DEBUG)
+        blob = stamp[:-1].rstrip() + b',' + payload[1:]
+        # Атомарная запись: обрыв посреди save не повредит файл мира
+        tmp = STATE_FILE + ".tmp"
+        try:
+            with open(tmp, 'wb') as f:
+                f.write(blob)
+            os.replace(tmp, STATE_FILE)
+        except:
+            # Ошибка уборки не должна скрыть исходную ошибку записи
+            try: os.remove(tmp)
+            except OSError: pass
+            raise
+        self._saved_hash = snapshot
 
 # --- СЕТЬ ---
+JSON_BLOCK_RE = re.compile(r'\{.*\}', re.DOTALL)
+
 def extract_json(text):
-    clean = text.replace("```json", "").replace("```", "").strip()
-    try: return json.loads(clean)
+    # Срезы вместо removeprefix/removesuffix: работает на любом Python 3.x
+    clean = text.strip()
+    if clean.startswith("```json"): clean = clean[7:]
+    elif clean.startswith("```"): clean = clean[3:]
+    if clean.endswith("```"): clean = clean[:-3]
+    clean = clean.strip()
+    try: return json_loads(clean)
     except: pass
     try:
-        match = re.search(r'(\{.*\})', text, re.DOTALL)
-        if match: return json.loads(match.group(1))
+        match = JSON_BLOCK_RE.search(text)
+        if match: return json_loads(match.group(0))
     except: pass
     return None
 
+def backoff_delay(attempt, retry_after=None, cap=30.0):
+    """Пауза перед повтором: Retry-After сервера или экспонента с джиттером."""
+    try:
+        if retry_after: return min(cap, max(0.0, float(retry_after)))
+    except ValueError: pass
+    return min(cap, (2 ** attempt) * (1 + random.random() * 0.5))
+
 def call_gemini(state, user_action, keys):
     if not keys: return None
     
@@ -154,32 +265,36 @@ def call_gemini(state, user_action, keys):
                 inv_safe.append(str(item))
     inv_str = ", ".join(inv_safe) if inv_safe else "Пусто"
     
-    prompt = (
-        f"{SYSTEM_PROMPT}\n\n"
+    prompt = PROMPT_HEADER + (
         f"ДАННЫЕ: Глубина {state.depth} | Энтропия {state.entropy:.2f} | Профиль {state.psych_profile}\n"
         f"ИНВЕНТАРЬ: {inv_str}\nКОНТЕКСТ: {state.last_context}\n"
         f"ДЕЙСТВИЕ ИГРОКА: \"{user_action}\""
     )
 
-    models = ["gemini-1.5-flash", "gemini-1.5-flash-8b", "gemini-2.0-flash-exp"]
     key = random.choice(keys)
+    try: session = get_session()
+    except ImportError:
+        print(f"\n{Col.RED}{Icon.WARN} {REQUESTS_MISSING}{Col.RESET}")
+        return None
 
-    for model in models:
+    for attempt, model in enumerate(MODELS):
         try:
             url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent?key={key}"
             payload = {"contents": [{"parts": [{"text": prompt}]}]}
-            headers = {"Content-Type": "application/json"}
             
             # Timeout 25s
-            response = requests.post(url, json=payload, headers=headers, timeout=25)
+            response = session.post(url, json=payload, headers=API_HEADERS, timeout=25)
             
             if response.status_code == 200:
-                data = response.json()
+                data = json_loads(response.content)
                 if 'candidates' in data:
                     text_resp = data['candidates'][0]['content']['parts'][0]['text']
                     parsed = extract_json(text_resp)
                     if parsed: return parsed
             elif response.status_code == 429:
+                # Лимит: ждём с разбросом, чтобы не ударить в лимит синхронно
+                if attempt < len(MODELS) - 1:
+                    time.sleep(backoff_delay(attempt, response.headers.get("Retry-After")))
                 continue
                 
         except Exception:
@@ -199,12 +314,36 @@ def draw_bar(value, max_val=1.5, width=10):
     
     return f"{Col.GREY}[{c}{bar}{Col.GREY}]{Col.RESET}"
 
+# Порядок важен: первый совпавший профиль побеждает
+PSYCH_KEYWORDS = (
+    ("Aggressive", ("убить", "сломать", "бить", "kill")),
+    ("Anxious",    ("бежать", "прятаться", "страх", "run")),
+    ("Analytical", ("осмотреть", "почему", "анализ", "look")),
+)
+# Кириллица не встречается в ASCII-вводе — для него хватит латинских слов
+PSYCH_KEYWORDS_ASCII = tuple(
+    (profile, tuple(w for w in words if w.isascii())) for profile, words in PSYCH_KEYWORDS
+)
+
+@lru_cache(maxsize=512)
+def classify_input(t):
+    """Профиль по ключевым словам (или None). Игроки часто повторяют команды."""
+    table = PSYCH_KEYWORDS_ASCII if t.isascii() else PSYCH_KEYWORDS
+    for profile, words in table:
+        if any(w in t for w in words): return profile
+    return None
+
 def analyze_input(text, current):
-    t = text.lower()
-    if any(w in t for w in ["убить", "сломать", "бить", "kill"]): return "Aggressive"
-    if any(w in t for w in ["бежать", "прятаться", "страх", "run"]): return "Anxious"
-    if any(w in t for w in ["осмотреть", "почему", "анализ", "look"]): return "Analytical"
-    return current
+    return classify_input(text.lower()) or current
+
+def save_state(state):
+    """Сохранение, которое не роняет игровой цикл."""
+    try:
+        state.save()
+        return True
+    except (OSError, ValueError, TypeError) as e:
+        print(f"{Col.RED}{Icon.WARN} Не удалось сохранить мир: {e}{Col.RESET}")
+        return False
 
 # --- MAIN ---
 def main():
@@ -214,6 +353,11 @@ def main():
     print(f"║   CONTRAST EDITION (International)    ║")
     print(f"╚═══════════════════════════════════════╝{Col.RESET}")
     
+    # requests импортируется лениво, но его отсутствие видно сразу (find_spec не импортирует)
+    if find_spec("requests") is None:
+        print(f"{Col.RED}{Icon.WARN} {REQUESTS_MISSING}{Col.RESET}")
+        return
+    
     # Загрузка ключей (безопасная)
     keys = get_api_keys()
     if not keys:
@@ -246,8 +390,8 @@ def main():
         if not user_input: user_input = "Осмотреться"
         
         if user_input.lower() in ["exit", "выход", "save"]:
-            state.save()
-            print(f"{Col.GREEN}{Icon.SAVE} Сохранено.{Col.RESET}")
+            if save_state(state):
+                print(f"{Col.GREEN}{Icon.SAVE} Сохранено.{Col.RESET}")
             if "save" not in user_input.lower(): break
             continue
 
@@ -281,9 +425,12 @@ def main():
                 print(f"{Col.BLUE}{i}. {c}{Col.RESET}")
             
             shift = resp.get('entropy_shift', 0.02)
-            state.entropy = max(0.0, state.entropy + shift)
+            if not is_finite_number(shift): shift = 0.02
+            entropy = max(0.0, state.entropy + shift)
+            # 1e308 + 1e308 = inf: конечный сдвиг ещё не гарантирует конечную сумму
+            if is_finite_number(entropy): state.entropy = entropy
             state.last_context = nar
-            state.save()
+            save_state(state)
             
         else:
             print(f"\n{Col.RED}{Icon.WARN} Сигнал потерян. Слабая сеть. Попробуй еще раз.{Col.RESET}")